@@ -3,3 +3,5 @@ from . import utils
 
 from .fileformat import read
 from .fileformat import write
+from .fileformat import compile_reader
+from .fileformat import uncompile_reader
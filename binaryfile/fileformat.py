@@ -1,25 +1,71 @@
 from abc import ABC, abstractmethod
 from os import SEEK_CUR
+import re
 import struct
+import functools
 import io
+import mmap
 
 from .utils import SimpleDict
 
-def read(handle, definition, result_type=SimpleDict):
+def read(handle, definition, result_type=SimpleDict, preserve_skipped=True):
 	"""
 	Read from a binary file handle and iterpret it using the file definition.
 	
 	Arguments:
-	handle -- The file-like object to read from. Must be binary.
+	handle -- The file-like object to read from. Must be binary. mmap objects and BytesIO are read in place, other seekable handles are read ahead in blocks that grow as more of them is used, and handles that can't seek are read as the fields need it, so that nothing after the data is consumed. If the handle is seekable, it is left positioned just after the last byte used by the definition.
 	definition -- The function defining the file structure. Must take one argument of type BinarySectionBase.
 	result_type -- Override the type of the return value with this dict-like type. Must implement __getitem__, __setitem__ and __contains__.
+	preserve_skipped -- Whether to keep skipped bytes in the result as '__skipped', so that they are written back. If False, skipped bytes are not copied at all, and are written back as zeros.
 
 	Returns a dict of names from the definition mapped to values from the file handle. Subsections become sub-dicts.
 	"""
-	reader = BinarySectionReader(handle, result_type)
-	definition(reader)
+	reader = BinarySectionReader(handle, result_type, preserve_skipped)
+	try:
+		reader._run(definition)
+	finally:
+		reader._finish()
 	return reader.result
 
+def compile_reader(definition):
+	"""
+	Compile a definition into a single function that reads all of its fields in one go. Later calls to read() with this definition use the compiled function instead of running the definition, and so does section() when this definition is used for a subsection. So a definition that depends on the data can't be compiled itself, but can still benefit from compiling the definitions of its fixed-layout subsections.
+
+	The definition is run once, against a section that records the fields it declares instead of reading them, so side effects of the definition only happen during this call. This means that the layout must not depend on the data: the values returned by the section methods may be stored, but not inspected, compared or used as sizes.
+	The compiled function is kept along with the definition until uncompile_reader() is called with it, so definitions built at runtime should be uncompiled when they are no longer used.
+
+	Arguments:
+	definition -- The function defining the file structure. Must take one argument of type BinarySectionBase.
+
+	Returns the compiled function, which takes a buffer, a position, a result type and whether to preserve skipped bytes, and returns the result and the position after it, or None if the buffer is too short.
+	Raises DefinitionError if the definition cannot be compiled.
+	"""
+	try:
+		hash(definition)
+	except TypeError:
+		raise DefinitionError(f'Cannot compile {definition!r}, since it is not hashable.') from None
+	compiler = _ReaderCompiler()
+	tracer = _TracingSection(compiler)
+	try:
+		definition(tracer)
+	except Exception as e:
+		raise DefinitionError(f'Cannot compile {getattr(definition, "__qualname__", repr(definition))}, since it failed while being traced. The layout must not depend on the data being read.') from e
+	compiled = compiler.build(tracer.result, getattr(definition, '__qualname__', 'definition'))
+	_compiled_readers[definition] = compiled
+	return compiled
+
+def uncompile_reader(definition):
+	"""
+	Forget the compiled function for a definition, so that read() and section() run the definition again, and neither is kept alive by compile_reader() any more.
+
+	Arguments:
+	definition -- A definition passed to compile_reader() before. Nothing happens if it wasn't.
+	"""
+	try:
+		_compiled_readers.pop(definition, None)
+	except TypeError:
+		pass
+
 def write(handle, data, definition, buffered=True):
 	"""
 	Write data to a binary file handle, interpreted using the file definition.
@@ -28,16 +74,116 @@ def write(handle, data, definition, buffered=True):
 	handle -- The file-like object to write to. Must be binary.
 	data -- A dict of data to write to the handle. Must map all named fields in the definition to values. The output from read() should work.
 	definition -- The function defining the file structure. Must take one argument of type BinarySectionBase.
-	buffered -- Whether to write to a memory buffer first, to avoid writing partial data to the handle in the event of an error.
+	buffered -- Whether to avoid writing partial data to the handle in the event of an error. The output is always collected in memory and written with a single call; if not buffered, whatever was produced before an error is still written.
+	"""
+	writer = BinarySectionWriter(handle, data)
+	try:
+		definition(writer)
+	except BaseException:
+		if not buffered:
+			handle.write(writer._out)
+		raise
+	handle.write(writer._out)
+
+# Struct formats for the common integer sizes, keyed by (size, byteorder, signed), and precompiled structs for them.
+_INT_FORMATS = {
+	(size, byteorder, signed): prefix + (code if signed else code.upper())
+	for size, code in ((1, 'b'), (2, 'h'), (4, 'i'), (8, 'q'))
+	for byteorder, prefix in (('big', '>'), ('little', '<'))
+	for signed in (True, False)
+}
+_INT_STRUCTS = {key: struct.Struct(int_format) for key, int_format in _INT_FORMATS.items()}
+# Their bound methods, so that the hot paths go straight into the C implementation without an attribute lookup per field.
+_INT_UNPACK_FROM = {key: int_struct.unpack_from for key, int_struct in _INT_STRUCTS.items()}
+_INT_PACK = {key: int_struct.pack for key, int_struct in _INT_STRUCTS.items()}
+
+@functools.lru_cache(maxsize=256)
+def _compile(formatstr):
+	"""Get a compiled struct for formatstr, so that each format string is only parsed once."""
+	return struct.Struct(formatstr)
+
+@functools.lru_cache(maxsize=256)
+def _integer_fields(formatstr):
+	"""Get whether each value in the struct format formatstr is an integer, so that they can be converted with int() before writing, like other integer fields."""
+	fields = []
+	for count, code in re.findall(r'(\d*)([a-zA-Z?])', formatstr):
+		if code in 'sp':
+			# A string is a single value, whatever its length.
+			fields.append(False)
+		elif code != 'x':
+			fields.extend([code in 'bBhHiIlLqQnNP'] * int(count or 1))
+	return tuple(fields)
+
+# Compiled readers from compile_reader(), keyed by definition. The definitions are kept alive, since a bound method is created anew each time it is looked up,
+# and only compares equal to the others for the same function and object.
+_compiled_readers = {}
+
+# Seekable handles are read ahead in blocks starting at this size, so that a short record doesn't read far past its end,
+_MIN_READ_AHEAD = 1024
+# and doubling up to this size, so that a long definition only refills now and then.
+_MAX_READ_AHEAD = 1 << 20
+
+def _format_name(name):
+	"""Format a field name for messages. A (name, index) tuple stands for an array element, and is only formatted here, when it is needed."""
+	if isinstance(name, tuple):
+		return f'{name[0]}[{name[1]}]'
+	return name
+
+def _open(handle):
 	"""
-	if buffered:
-		buffer = io.BytesIO()
-	else:
-		buffer = handle
-	writer = BinarySectionWriter(buffer, data)
-	definition(writer)
-	if buffered:
-		handle.write(buffer.getvalue())
+	Get the data to read from handle, so that fields are sliced from it rather than read with handle.read() one by one.
+	Returns the data as bytes or an mmap, the position in it, the handle if it is a stream that is read as needed, and the offset of the buffer in the handle if it should be seeked when done.
+	"""
+	if isinstance(handle, mmap.mmap):
+		# Already mapped, so read it in place. It is the caller's to close.
+		return handle, handle.tell(), None, 0
+	if type(handle) is io.BytesIO:
+		# getvalue() hands over the BytesIO's own bytes rather than a copy, unlike getbuffer() its slices are bytes, and it doesn't stop the caller from resizing the BytesIO afterwards.
+		return handle.getvalue(), handle.tell(), None, 0
+	if not _seekable(handle):
+		# Reading ahead would consume data that comes after this, and can block on pipes and sockets, so the buffer is filled as fields need it.
+		return b'', 0, handle, None
+	# Read ahead as fields need it, and seek back to the end of what was used when done.
+	return b'', 0, handle, handle.tell()
+
+def _seekable(handle):
+	try:
+		return handle.seekable()
+	except AttributeError:
+		return False
+
+def _int_reader(signed):
+	"""Make the int or uint method of BinarySectionReader. The common sizes are handled by the method itself, without going through _int."""
+	def read_int(self, name, size, byteorder=None):
+		unpack_from = _INT_UNPACK_FROM.get((size, byteorder or self.byteorder, signed))
+		if unpack_from is None:
+			return self._int(name, size, byteorder, signed)
+		buf = self._buf
+		pos = self._pos
+		if pos + size > len(buf):
+			if not self._fill(size):
+				raise EOFError(f'While reading {self.get_qualified_field_name(name)}')
+			buf = self._buf
+			pos = 0
+		result = unpack_from(buf, pos)[0]
+		self._pos = pos + size
+		self._add_result(name, result)
+		return result
+	return read_int
+
+def _int_writer(signed):
+	"""Make the int or uint method of BinarySectionWriter. The common sizes are handled by the method itself, without going through _int."""
+	def write_int(self, name, size, byteorder=None):
+		pack = _INT_PACK.get((size, byteorder or self.byteorder, signed))
+		if pack is None:
+			return self._int(name, size, byteorder, signed)
+		value = int(self._get_data(name))
+		try:
+			self._out += pack(value)
+		except struct.error:
+			raise self._range_error(name, value, size, signed) from None
+		return value
+	return write_int
 
 class DefinitionError(Exception):
 	"""Throw when the definition contains errors."""
@@ -62,11 +208,13 @@ class BinarySectionBase(ABC):
 		self.byteorder = 'big'
 		self.name = '(root)'
 		self.parent = None
+		# The position of this section in an array of sections, which is only formatted into its name if an error message needs it.
+		self._index = None
 	@abstractmethod
 	def skip(self, size):
 		"""
 		Skip size number of bytes that you don't really care about.
-		After reading, the skipped fields are sill available in the result as an array named '__skipped', and will be written back when writing.
+		After reading, the skipped fields are still available in the result as an array named '__skipped' (unless read with preserve_skipped=False), and will be written back when writing.
 		"""
 	@abstractmethod
 	def section(self, name, definition):
@@ -87,6 +235,20 @@ class BinarySectionBase(ABC):
 		"""
 		...
 	@abstractmethod
+	def repeat_until(self, name, definition, key, sentinel):
+		"""
+		Declare an array of sections using the given definition, ending with the first section whose key field equals sentinel.
+		The final section is included in the array.
+		
+		name -- The name of the array field.
+		definition -- A function that takes a BinarySectionBase and defines each section.
+		key -- The name of the field in each section that is compared with sentinel.
+		sentinel -- The value of the key field that ends the array.
+		
+		Returns the array.
+		"""
+		...
+	@abstractmethod
 	def count(self, name, target_name, size, byteorder=None):
 		"""
 		Like uint, but is automatically updated with the len() of target_name.
@@ -98,11 +260,23 @@ class BinarySectionBase(ABC):
 		"""
 		...
 	@abstractmethod
-	def bytes(self, name, size):
+	def bytes(self, name, size, mutable=False):
 		"""
 		Declare size number of bytes.
 		name -- The name of the field containing the bytes.
 		size -- The number of bytes the field occupies.
+		mutable -- Whether to read the field as a bytearray instead of bytes, so that it can be modified in place without copying it first.
+		
+		Returns the bytes.
+		"""
+		...
+	@abstractmethod
+	def scan_until(self, name, pattern):
+		"""
+		Declare the bytes up to the next occurrence of pattern. The pattern itself is not part of the field, and is left to be declared next.
+		Raises EOFError when reading if the pattern isn't found, and DataFormatError when writing if the field contains the pattern.
+		name -- The name of the field containing the bytes.
+		pattern -- The bytes that end the field.
 		
 		Returns the bytes.
 		"""
@@ -141,86 +315,306 @@ class BinarySectionBase(ABC):
 		Returns the struct as a tuple.
 		"""
 		...
+	@abstractmethod
+	def ints(self, names, formatstr):
+		"""
+		Declare several adjacent fields, typically integers, with a single struct format. Reading or writing them together is faster than declaring them one by one.
+		names -- The names of the fields, one for each value in the struct.
+		formatstr -- A string defining the struct format, as specified in Python's built-in struct module.
+
+		Returns the values as a tuple.
+		"""
+		...
 	def qualified_name(self):
 		"""Get the name of parent sections and this section as a list."""
-		if self.parent:
-			return self.parent.qualified_name() + [self.name]
-		return [self.name]
+		names = []
+		section = self
+		while section is not None:
+			if section._index is None:
+				names.append(section.name)
+			else:
+				names.append(f'{section.name}[{section._index}]')
+			section = section.parent
+		names.reverse()
+		return names
 	def get_qualified_field_name(self, name):
 		"""Get the qualified name of the named field, including the name of this section and its parents, as a dotted string. Useful for error messages."""
-		return '.'.join(self.qualified_name() + [name])
+		return '.'.join(self.qualified_name() + [_format_name(name)])
 
 class BinarySectionReader(BinarySectionBase):
-	def __init__(self, handle, result_type=dict):
+	def __init__(self, handle, result_type=dict, preserve_skipped=True):
 		super().__init__(handle)
 		self.result = result_type()
-		self.arrays = set()
+		self.arrays = {}
+		self.preserve_skipped = preserve_skipped
+		self._result_type = result_type
+		# Fields are sliced from _data, which gives bytes directly, and unpacked from the _buf view of it.
+		data, pos, stream, origin = _open(handle)
+		self._data = data
+		self._buf = memoryview(data)
+		self._pos = pos
+		self._stream = stream
+		self._origin = origin
 	def skip(self, size):
+		if not self.preserve_skipped:
+			self._advance('__skipped', size)
+			return
 		if not '__skipped' in self.result:
 			self.result['__skipped'] = []
 		skipped = self.result['__skipped']
-		name = f'__skipped[{len(skipped)}]'
-		skipped.append(self._read_bytes(name, size))
+		skipped.append(self._read_bytes(('__skipped', len(skipped)), size))
 	def section(self, name, definition):
-		section = self._section(name, definition)
-		self._add_result(name, section.result)
-		return section.result
+		array = self.arrays.get(name)
+		if array is None:
+			result = self._section(name, definition).result
+			self._add_result(name, result)
+		else:
+			result = self._section(name, definition, len(array)).result
+			array.append(result)
+		return result
 	def array(self, name):
-		self.result[name] = []
-		self.arrays.add(name)
+		array = []
+		self.result[name] = array
+		self.arrays[name] = array
+	def repeat_until(self, name, definition, key, sentinel):
+		self.array(name)
+		array = self.arrays[name]
+		# Goes straight to _section, skipping the per-element lookups that section() does.
+		while True:
+			result = self._section(name, definition, len(array)).result
+			array.append(result)
+			if result[key] == sentinel:
+				return array
 	def count(self, name, array_name, size, byteorder=None):
 		return self.uint(name, size, byteorder)
-	def bytes(self, name, size):
-		result = self._read_bytes(name, size)
+	def bytes(self, name, size, mutable=False):
+		# Fields of a known size that are already in the buffer are handled here, without going through _advance.
+		data = self._data
+		pos = self._pos
+		if size is None or size == -1 or pos + size > len(data):
+			pos = self._advance(name, size)
+			data = self._data
+			end = self._pos
+		else:
+			end = pos + size
+			self._pos = end
+		result = bytearray(data[pos:end]) if mutable else data[pos:end]
 		self._add_result(name, result)
 		return result
-	def int(self, name, size, byteorder=None):
-		return self._int(name, size, byteorder, signed=True)
-	def uint(self, name, size, byteorder=None):
-		return self._int(name, size, byteorder, signed=False)
+	def scan_until(self, name, pattern):
+		data = self._data
+		pos = self._pos
+		end = data.find(pattern, pos)
+		if end == -1:
+			end = self._fill_until(pattern)
+			if end == -1:
+				raise EOFError(f'While scanning {self.get_qualified_field_name(name)} for {pattern!r}')
+			data = self._data
+			pos = 0
+		result = data[pos:end]
+		self._pos = end
+		self._add_result(name, result)
+		return result
+	int = _int_reader(signed=True)
+	uint = _int_reader(signed=False)
 	def struct(self, name, formatstr):
-		size = struct.calcsize(formatstr)
-		bytes_ = self._read_bytes(name, size)
-		result = struct.unpack(formatstr, bytes_)
+		compiled = _compile(formatstr)
+		pos = self._advance(name, compiled.size)
+		result = compiled.unpack_from(self._buf, pos)
 		self._add_result(name, result)
 		return result
-	def _section(self, name, definition):
-		section = type(self)(self.handle, type(self.result))
-		section.parent = self
-		section.name = name
-		definition(section)
+	def ints(self, names, formatstr):
+		compiled = _compile(formatstr)
+		buf = self._buf
+		pos = self._pos
+		if pos + compiled.size > len(buf):
+			if not self._fill(compiled.size):
+				raise EOFError(f'While reading {", ".join(map(self.get_qualified_field_name, names))}')
+			buf = self._buf
+			pos = 0
+		values = compiled.unpack_from(buf, pos)
+		if len(values) != len(names):
+			raise DefinitionError(f'Got {len(names)} names for the {len(values)} values in struct format "{formatstr}".')
+		self._pos = pos + compiled.size
+		for name, value in zip(names, values):
+			self._add_result(name, value)
+		return values
+	def _section(self, name, definition, index=None):
+		section = self._spawn_child(name, index)
+		section._run(definition)
+		if self._stream is not None:
+			# The stream may have been read further into a new buffer.
+			self._data = section._data
+			self._buf = section._buf
+			self._origin = section._origin
+		self._pos = section._pos
 		return section
+	def _spawn_child(self, name, index):
+		"""Create a subsection sharing this section's buffer, setting its fields directly instead of going through __init__."""
+		child = object.__new__(type(self))
+		child.handle = self.handle
+		child.byteorder = 'big'
+		child.name = name
+		child.parent = self
+		child._index = index
+		child.result = self._result_type()
+		child.arrays = {}
+		child.preserve_skipped = self.preserve_skipped
+		child._result_type = self._result_type
+		child._data = self._data
+		child._buf = self._buf
+		child._pos = self._pos
+		child._stream = self._stream
+		child._origin = self._origin
+		return child
 	def _read_bytes(self, name, size):
-		bytes_ = self.handle.read(size)
+		pos = self._advance(name, size)
+		return self._data[pos:self._pos]
+	def _advance(self, name, size):
+		"""Move past size bytes without copying them, and return where they start."""
+		pos = self._pos
 		if size is None or size == -1:
-			return bytes_
-		if len(bytes_) < size:
-			raise EOFError(f'While reading {self.get_qualified_field_name(name)}')
-		return bytes_
+			if self._stream is not None:
+				self._fill(None)
+				pos = 0
+			end = len(self._buf)
+		else:
+			end = pos + size
+			if end > len(self._buf):
+				if not self._fill(size):
+					raise EOFError(f'While reading {self.get_qualified_field_name(name)}')
+				pos = 0
+				end = size
+		self._pos = end
+		return pos
+	def _fill(self, size):
+		"""
+		When reading from the handle, read enough of it that the buffer starts with the next size bytes, or with the rest of the handle if size is None.
+		Handles that can seek are read ahead in growing blocks, and handles that can't are read no further than needed.
+		Returns whether there were enough bytes, which there never are when the buffer already holds all of the data.
+		"""
+		stream = self._stream
+		if stream is None:
+			return False
+		pos = self._pos
+		chunks = [self._data[pos:]]
+		enough = True
+		if size is None:
+			chunks.append(stream.read())
+		else:
+			missing = size - len(chunks[0])
+			wanted = missing
+			if self._origin is not None:
+				wanted = max(missing, _MIN_READ_AHEAD, min(2 * len(self._data), _MAX_READ_AHEAD))
+			while missing > 0:
+				chunk = stream.read(wanted)
+				if not chunk:
+					enough = False
+					break
+				chunks.append(chunk)
+				missing -= len(chunk)
+				wanted -= len(chunk)
+		if self._origin is not None:
+			self._origin += pos
+		# Kept even if there isn't enough, so that a definition run after a compiled reader gave up still sees it.
+		self._set_data(b''.join(chunks))
+		return enough
+	def _fill_until(self, pattern):
+		"""Like _fill, but reads until the buffer contains pattern, and returns where it starts in the new buffer, or -1 if the data ends first."""
+		stream = self._stream
+		if stream is None:
+			return -1
+		pos = self._pos
+		data = bytearray(self._data[pos:])
+		found = -1
+		if self._origin is None:
+			# One byte at a time, since anything read past the pattern could not be put back.
+			while found == -1:
+				byte = stream.read(1)
+				if not byte:
+					break
+				data += byte
+				if data.endswith(pattern):
+					found = len(data) - len(pattern)
+		else:
+			wanted = _MIN_READ_AHEAD
+			while found == -1:
+				chunk = stream.read(wanted)
+				if not chunk:
+					break
+				# The pattern may start in the part that was already searched.
+				start = max(len(data) - len(pattern) + 1, 0)
+				data += chunk
+				found = data.find(pattern, start)
+				wanted = min(2 * wanted, _MAX_READ_AHEAD)
+			self._origin += pos
+		self._set_data(bytes(data))
+		return found
+	def _set_data(self, data):
+		"""Replace the buffer with data, read from a stream, and start at its beginning."""
+		self._data = data
+		self._buf = memoryview(data)
+		self._pos = 0
+	def _run(self, definition):
+		"""Fill in this section using definition, or its compiled reader if it has one."""
+		try:
+			compiled = _compiled_readers.get(definition)
+		except TypeError:
+			compiled = None
+		if compiled is not None:
+			if self._stream is not None:
+				# The compiled reader only sees what is already buffered. Its layout is fixed, so what it needs is exactly what the definition would read.
+				if compiled._reads_rest:
+					self._fill(None)
+				elif len(self._buf) - self._pos < compiled._minimum:
+					self._fill(compiled._minimum)
+			done = compiled(self._buf, self._pos, self._result_type, self.preserve_skipped)
+			if done is not None:
+				self.result, self._pos = done
+				return
+		# Either not compiled, or there isn't enough data, in which case the definition reports where it ran out.
+		definition(self)
+	def _finish(self):
+		"""Leave the handle just after the last byte that was actually used, as if it had been read field by field, and let go of the buffer."""
+		if self._origin is not None and (self._stream is None or self._pos != len(self._data)):
+			# A handle that was read ahead is already in place if all of it was used, and seeking a compressed file back can be costly.
+			self.handle.seek(self._origin + self._pos)
+		try:
+			self._buf.release()
+		except BufferError:
+			# Something still holds a view of the buffer, so leave it to be freed along with that.
+			pass
 	def _int(self, name, size, byteorder, signed):
+		"""Read an integer of any size, for the sizes that int and uint don't handle themselves."""
 		if byteorder is None:
 			byteorder = self.byteorder
-		bytes_ = self._read_bytes(name, size)
-		result = int.from_bytes(bytes_, byteorder=byteorder, signed=signed)
+		pos = self._advance(name, size)
+		result = int.from_bytes(self._buf[pos:self._pos], byteorder=byteorder, signed=signed)
 		self._add_result(name, result)
 		return result
 	def _add_result(self, name, result):
-		if name in self.result:
-			if name in self.arrays:
-				self.result[name].append(result)
-			else:
-				raise DefinitionError(f'Used "{name}" multiple times in the same section without declaring it an array.')
+		results = self.result
+		if name in results:
+			self._append_result(name, result)
 		else:
-			self.result[name] = result
+			results[name] = result
+	def _append_result(self, name, result):
+		"""Add result to an array. Called for names that are already in the result, which is only allowed for arrays."""
+		array = self.arrays.get(name)
+		if array is None:
+			raise DefinitionError(f'Used "{name}" multiple times in the same section without declaring it an array.')
+		array.append(result)
 
 class BinarySectionWriter(BinarySectionBase):
 	def __init__(self, handle, data):
 		super().__init__(handle)
 		self.data = data
 		self.indices = {}
+		# Collect all output here and let write() hand it to the handle in one go.
+		self._out = bytearray()
 	def skip(self, size):
 		if not '__skipped' in self.data:
-			self.handle.write(b'\x00' * size)
+			self._out += bytes(size)
 			return
 		if not '__skipped' in self.indices:
 			self.array('__skipped')
@@ -228,37 +622,79 @@ class BinarySectionWriter(BinarySectionBase):
 		self._write_bytes('__skipped', size, bytes_)
 		return bytes_
 	def section(self, name, definition):
+		index = self.indices.get(name)
 		data = self._get_data(name)
-		self._section(name, data, definition)
+		self._section(name, data, definition, index)
 		return data
 	def array(self, name):
 		self.indices[name] = 0
+	def repeat_until(self, name, definition, key, sentinel):
+		self.array(name)
+		while True:
+			data = self.section(name, definition)
+			if data[key] == sentinel:
+				return self.data[name]
 	def count(self, name, array_name, size, byteorder=None):
-		self.data[name] = len(self.data[array_name])
-		return self.uint(name, size, byteorder)
-	def bytes(self, name, size):
+		value = len(self.data[array_name])
+		self.data[name] = value
+		pack = _INT_PACK.get((size, byteorder or self.byteorder, False))
+		if pack is None:
+			return self.uint(name, size, byteorder)
+		# The length is already an int, so write it directly instead of reading it back through uint.
+		try:
+			self._out += pack(value)
+		except struct.error:
+			raise self._range_error(name, value, size, signed=False) from None
+		return value
+	def bytes(self, name, size, mutable=False):
 		bytes_ = self._get_data(name)
 		self._write_bytes(name, size, bytes_)
 		return bytes_
-	def int(self, name, size, byteorder=None):
-		return self._int(name, size, byteorder, signed=True)
-	def uint(self, name, size, byteorder=None):
-		return self._int(name, size, byteorder, signed=False)
+	def scan_until(self, name, pattern):
+		bytes_ = self._get_data(name)
+		if pattern in bytes_:
+			raise DataFormatError(f'While writing bytes {self.get_qualified_field_name(name)}: {repr(bytes_)} contains {repr(pattern)}, so it could not be read back.')
+		self._out += bytes_
+		return bytes_
+	int = _int_writer(signed=True)
+	uint = _int_writer(signed=False)
 	def struct(self, name, formatstr):
 		data = self._get_data(name)
 		try:
-			bytes_ = struct.pack(formatstr, *data)
+			bytes_ = _compile(formatstr).pack(*data)
 		except struct.error as e:
 			raise DataFormatError(f'While writing struct {self.get_qualified_field_name(name)}: {str(e)}')
-		self.handle.write(bytes_)
+		self._out += bytes_
 		return self.data[name]
-	def _section(self, name, data, definition):
-		section = type(self)(self.handle, data)
-		section.parent = self
-		section.name = name
+	def ints(self, names, formatstr):
+		integers = _integer_fields(formatstr)
+		if len(integers) != len(names):
+			raise DefinitionError(f'Got {len(names)} names for the {len(integers)} values in struct format "{formatstr}".')
+		values = tuple(int(self._get_data(name)) if integer else self._get_data(name) for name, integer in zip(names, integers))
+		try:
+			bytes_ = _compile(formatstr).pack(*values)
+		except struct.error as e:
+			raise DataFormatError(f'While writing {", ".join(map(self.get_qualified_field_name, names))}: {str(e)}')
+		self._out += bytes_
+		return values
+	def _section(self, name, data, definition, index=None):
+		section = self._spawn_child(name, data, index)
 		definition(section)
 		return section.data
+	def _spawn_child(self, name, data, index):
+		"""Create a subsection sharing this section's output, setting its fields directly instead of going through __init__."""
+		child = object.__new__(type(self))
+		child.handle = self.handle
+		child.byteorder = 'big'
+		child.name = name
+		child.parent = self
+		child._index = index
+		child.data = data
+		child.indices = {}
+		child._out = self._out
+		return child
 	def _int(self, name, size, byteorder, signed):
+		"""Write an integer of any size, for the sizes that int and uint don't handle themselves."""
 		value = int(self._get_data(name))
 		if size is None or size == -1:
 			size = (value.bit_length() + 7) // 8
@@ -266,21 +702,277 @@ class BinarySectionWriter(BinarySectionBase):
 			byteorder = self.byteorder
 		try:
 			bytes_ = value.to_bytes(size, byteorder=byteorder, signed=signed)
-		except OverflowError as e:
-			raise DataFormatError(f'While writing (u)int {self.get_qualified_field_name(name)}: {str(e)}')
-		self.handle.write(bytes_)
+		except OverflowError:
+			raise self._range_error(name, value, size, signed) from None
+		self._out += bytes_
 		return value
-	def _get_data(self, name):
-		if name in self.indices:
-			if self.indices[name] >= len(self.data[name]):
-				raise DataFormatError(f'Data array "{name}" has {len(self.data[name])} items, but more are required.')
-			result = self.data[name][self.indices[name]]
-			self.indices[name] += 1
+	def _range_error(self, name, value, size, signed):
+		"""Make the error for an integer that doesn't fit in its field. Only called after packing has failed, so that the bounds aren't checked separately for every field."""
+		bits = size * 8
+		if signed and bits:
+			low, high = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
 		else:
-			result = self.data[name]
-		return result
+			low, high = 0, (1 << bits) - 1
+		kind = 'signed' if signed else 'unsigned'
+		return DataFormatError(f'While writing (u)int {self.get_qualified_field_name(name)}: {value} is outside the range {low} to {high} of a {size} byte {kind} integer.')
+	def _get_data(self, name):
+		index = self.indices.get(name)
+		if index is None:
+			return self.data[name]
+		array = self.data[name]
+		if index >= len(array):
+			raise DataFormatError(f'Data array "{name}" has {len(array)} items, but more are required.')
+		self.indices[name] = index + 1
+		return array[index]
 	def _write_bytes(self, name, size, bytes_):
 		if not (size is None or size == -1):
 			if len(bytes_) != size:
 				raise DataFormatError(f'While writing bytes {self.get_qualified_field_name(name)}: Expected {repr(bytes_)} to be {size} bytes long.')
-		self.handle.write(bytes_)
+		self._out += bytes_
+
+
+class _TracedValue:
+	"""Stands in for the values read while tracing. Inspecting it means the layout depends on the data, so it refuses."""
+	__slots__ = ()
+	def _refuse(self, *args, **kwargs):
+		raise DefinitionError('The definition used a value read from the data.')
+	__bool__ = __eq__ = __ne__ = __hash__ = __str__ = __format__ = __getattr__ = _refuse
+
+class _TracingSection(BinarySectionReader):
+	"""A section that records the declared fields with _ReaderCompiler, instead of reading them. Used by compile_reader()."""
+	def __init__(self, compiler, parent=None):
+		BinarySectionBase.__init__(self, None)
+		self.parent = parent
+		self.result = {}
+		self.arrays = {}
+		self._compiler = compiler
+	def skip(self, size):
+		if not '__skipped' in self.result:
+			self.result['__skipped'] = []
+		self.result['__skipped'].append(self._compiler.skip(size))
+	def section(self, name, definition):
+		section = _TracingSection(self._compiler, self)
+		section.name = name
+		definition(section)
+		self._add_result(name, section.result)
+		return _TracedValue()
+	def repeat_until(self, name, definition, key, sentinel):
+		raise DefinitionError('The definition uses repeat_until, whose length depends on the data.')
+	def bytes(self, name, size, mutable=False):
+		self._add_result(name, self._compiler.bytes(size, mutable))
+		return _TracedValue()
+	def scan_until(self, name, pattern):
+		raise DefinitionError('The definition uses scan_until, whose length depends on the data.')
+	def struct(self, name, formatstr):
+		self._add_result(name, self._compiler.struct(formatstr))
+		# As many values as the struct has, so that they can be unpacked into names.
+		compiled = _compile(formatstr)
+		return tuple(_TracedValue() for value in compiled.unpack(bytes(compiled.size)))
+	def ints(self, names, formatstr):
+		values = self._compiler.fields(formatstr)
+		if len(values) != len(names):
+			raise DefinitionError(f'Got {len(names)} names for the {len(values)} values in struct format "{formatstr}".')
+		for name, value in zip(names, values):
+			self._add_result(name, value)
+		return tuple(_TracedValue() for value in values)
+	def int(self, name, size, byteorder=None):
+		return self._int(name, size, byteorder, signed=True)
+	def uint(self, name, size, byteorder=None):
+		return self._int(name, size, byteorder, signed=False)
+	def _int(self, name, size, byteorder, signed):
+		if byteorder is None:
+			byteorder = self.byteorder
+		array = self.arrays.get(name)
+		if array is not None and (size, byteorder, signed) in _INT_UNPACK_FROM:
+			element = self._compiler.array_int(array, size, byteorder, signed)
+			if element is not None:
+				array.append(element)
+		else:
+			self._add_result(name, self._compiler.int(size, byteorder, signed))
+		return _TracedValue()
+
+class _ReaderCompiler:
+	"""
+	Generates the source of a compiled reader. The fields are read into local variables at fixed offsets from the start position p,
+	or from the end of the buffer n once a field has read the rest of it, and the results are built from those at the end.
+	"""
+	def __init__(self):
+		self.lines = []
+		self.namespace = {'_from_bytes': int.from_bytes}
+		self.base = 'p'
+		self.offset = 0
+		self.minimum = 0
+		self.overrun = False
+		self.run = None
+	def bytes(self, size, mutable=False):
+		start, end = self._span(size)
+		if mutable:
+			return self._value(f'bytearray(b[{start}:{end}])')
+		return self._value(f'b[{start}:{end}].tobytes()')
+	def skip(self, size):
+		# Only copied when building the result, and only if skipped bytes are preserved.
+		start, end = self._span(size)
+		return f'b[{start}:{end}].tobytes()'
+	def struct(self, formatstr):
+		compiled = _compile(formatstr)
+		start, end = self._span(compiled.size)
+		return self._value(f'{self._constant(compiled.unpack_from)}(b, {start})')
+	def fields(self, formatstr):
+		"""Like struct, but unpacks each value into its own variable."""
+		compiled = _compile(formatstr)
+		count = len(compiled.unpack(bytes(compiled.size)))
+		start, end = self._span(compiled.size)
+		variables = [f'v{len(self.lines)}_{i}' for i in range(count)]
+		if variables:
+			self.lines.append(f'{", ".join(variables)}, = {self._constant(compiled.unpack_from)}(b, {start})')
+		return variables
+	def int(self, size, byteorder, signed):
+		if byteorder not in ('big', 'little'):
+			raise ValueError("byteorder must be either 'little' or 'big'")
+		key = (size, byteorder, signed)
+		run = self.run
+		start, end = self._span(size)
+		if key not in _INT_FORMATS:
+			return self._value(f'_from_bytes(b[{start}:{end}], {byteorder!r}, signed={signed})')
+		# Consecutive integers of the same byte order are unpacked with a single struct.
+		if isinstance(run, _FieldRun) and run.byteorder == byteorder:
+			self.run = run
+		else:
+			self.run = _FieldRun(byteorder, f'v{len(self.lines)}', start)
+			self.lines.append(self.run)
+		return self.run.add(key)
+	def array_int(self, array, size, byteorder, signed):
+		"""
+		Like int, but for an element of array. Consecutive elements of the same kind in the same array are unpacked with a single struct,
+		so only the first of them returns an element, which expands to all of them. The others return None.
+		"""
+		key = (size, byteorder, signed)
+		run = self.run
+		start, end = self._span(size)
+		if isinstance(run, _ArrayRun) and run.key == key and run.array is array:
+			run.count += 1
+			self.run = run
+			return None
+		self.run = _ArrayRun(key, array, f'v{len(self.lines)}', start)
+		self.lines.append(self.run)
+		return f'*{self.run.variable}'
+	def build(self, result, name):
+		"""Compile the function that reads the traced fields and returns them as result does."""
+		lines = [f'def compiled(b, p, result_type, preserve_skipped):']
+		if self.overrun:
+			lines.append('\treturn None')
+		else:
+			lines.append(f'\tif len(b) - p < {self.minimum}:')
+			lines.append('\t\treturn None')
+			lines.append('\tn = len(b)')
+			lines.extend('\t' + (line if isinstance(line, str) else line.render(self)) for line in self.lines)
+			end = self._at(self.offset)
+			# Results of the built-in types are built with a single dict display per section, instead of a store per field.
+			for condition, style in (('result_type is dict', 'dict'), ('result_type is _SimpleDict', 'mapping'), (None, 'items')):
+				self.lines = []
+				root = self._build_result(result, style)
+				indent = '\t'
+				if condition:
+					lines.append(f'\tif {condition}:')
+					indent = '\t\t'
+				lines.extend(indent + line for line in self.lines)
+				lines.append(f'{indent}return {root}, {end}')
+		namespace = dict(self.namespace, _SimpleDict=SimpleDict)
+		exec(compile('\n'.join(lines), f'<compiled {name}>', 'exec'), namespace)
+		compiled = namespace['compiled']
+		# How much of the buffer it needs, so that a stream can be read that far first.
+		compiled._minimum = self.minimum
+		compiled._reads_rest = self.base == 'n'
+		return compiled
+	def _build_result(self, result, style):
+		"""
+		Add lines building result, and return the variable it ends up in.
+		The style is 'dict' for a dict display, 'mapping' for result_type called with a dict display, or 'items' for storing each field into result_type().
+		"""
+		items = [(repr(key) if isinstance(key, str) else self._constant(key), key == '__skipped', self._expression(value, style)) for key, value in result.items()]
+		variable = f'r{len(self.lines)}'
+		if style == 'items':
+			self.lines.append(f'{variable} = result_type()')
+			for key, skipped, expression in items:
+				if skipped:
+					self.lines.append('if preserve_skipped:')
+					self.lines.append(f'\t{variable}[{key}] = {expression}')
+				else:
+					self.lines.append(f'{variable}[{key}] = {expression}')
+			return variable
+		# Skipped bytes keep their place in the display, but are only copied if preserved.
+		display = ', '.join(f'{key}: {expression} if preserve_skipped else None' if skipped else f'{key}: {expression}' for key, skipped, expression in items)
+		display = f'{{{display}}}' if style == 'dict' else f'result_type({{{display}}})'
+		self.lines.append(f'{variable} = {display}')
+		for key, skipped, expression in items:
+			if skipped:
+				self.lines.append('if not preserve_skipped:')
+				self.lines.append(f'\tdel {variable}[{key}]')
+		return variable
+	def _expression(self, value, style):
+		if isinstance(value, dict):
+			return self._build_result(value, style)
+		if isinstance(value, list):
+			return '[' + ', '.join(self._expression(item, style) for item in value) + ']'
+		return value
+	def _span(self, size):
+		"""Get the start and end of the next size bytes as expressions, and move past them."""
+		if size is None or size == -1:
+			self.run = None
+			start = self._at(self.offset)
+			self.base = 'n'
+			self.offset = 0
+			return start, ''
+		if isinstance(size, bool) or not isinstance(size, int) or size < 0:
+			raise DefinitionError(f'Cannot compile a field with size {size!r}.')
+		self.run = None
+		if size and self.base == 'n':
+			self.overrun = True
+		start = self._at(self.offset)
+		self.offset += size
+		if self.base == 'p':
+			self.minimum = self.offset
+		return start, self._at(self.offset)
+	def _at(self, offset):
+		return f'{self.base} + {offset}' if offset else self.base
+	def _value(self, expression):
+		variable = f'v{len(self.lines)}'
+		self.lines.append(f'{variable} = {expression}')
+		return variable
+	def _constant(self, value):
+		name = f'_c{len(self.namespace)}'
+		self.namespace[name] = value
+		return name
+
+class _FieldRun:
+	"""Consecutive integer fields of the same byte order, which a compiled reader unpacks in one go."""
+	def __init__(self, byteorder, variable, start):
+		self.byteorder = byteorder
+		self.variable = variable
+		self.start = start
+		self.keys = []
+	def add(self, key):
+		"""Add a field to the run, and return the variable it is unpacked into."""
+		self.keys.append(key)
+		return f'{self.variable}_{len(self.keys) - 1}'
+	def render(self, compiler):
+		formats = [_INT_FORMATS[key] for key in self.keys]
+		compiled = _compile(formats[0][0] + ''.join(int_format[1:] for int_format in formats))
+		variables = ', '.join(f'{self.variable}_{i}' for i in range(len(self.keys)))
+		return f'{variables}, = {compiler._constant(compiled.unpack_from)}(b, {self.start})'
+
+class _ArrayRun:
+	"""Consecutive integer elements of an array, which a compiled reader unpacks in one go."""
+	def __init__(self, key, array, variable, start):
+		self.key = key
+		self.array = array
+		self.variable = variable
+		self.start = start
+		self.count = 1
+	def render(self, compiler):
+		if self.key[0] == 1 and not self.key[2]:
+			# Unsigned bytes are already what the buffer holds.
+			return f'{self.variable} = b[{self.start}:{self.start} + {self.count}].tolist()'
+		int_format = _INT_FORMATS[self.key]
+		compiled = _compile(f'{int_format[0]}{self.count}{int_format[1:]}')
+		return f'{self.variable} = {compiler._constant(compiled.unpack_from)}(b, {self.start})'
@@ -1,8 +1,13 @@
 import unittest
 import io
 import struct
+import tempfile
+import mmap
+import gzip
+import os
 
 from binaryfile import fileformat
+from binaryfile.utils import SimpleDict
 
 class TestBinarySectionReader(unittest.TestCase):
 	def setUp(self):
@@ -14,6 +19,13 @@ class TestBinarySectionReader(unittest.TestCase):
 			f.skip(3)
 		result = fileformat.read(self.file, spec)
 		self.assertEqual(result, { '__skipped': [self.bytes[0:1], self.bytes[1:4]] })
+	def test_skip_not_preserved(self):
+		def spec(f):
+			f.skip(1)
+			f.section('section', lambda f: f.skip(2))
+			f.bytes('last', 1)
+		result = fileformat.read(self.file, spec, preserve_skipped=False)
+		self.assertEqual(result, { 'section': {}, 'last': self.bytes[3:] })
 	def test_count(self):
 		file = io.BytesIO(b'\x05Q12345Q')
 		def spec(f):
@@ -31,6 +43,14 @@ class TestBinarySectionReader(unittest.TestCase):
 			self.assertEqual(rest, self.bytes[1:])
 		result = fileformat.read(self.file, spec)
 		self.assertEqual(result, { 'first': self.bytes[:1], 'rest': self.bytes[1:] })
+	def test_bytes_mutable(self):
+		def spec(f):
+			f.bytes('first', 1)
+			f.bytes('rest', None, mutable=True)
+		result = fileformat.read(self.file, spec)
+		self.assertIsInstance(result.first, bytes)
+		self.assertIsInstance(result.rest, bytearray)
+		self.assertEqual(result.rest, self.bytes[1:])
 	def test_uint(self):
 		expected_value = int.from_bytes(self.bytes[:4], 'big', signed=False)
 		def spec(f):
@@ -45,11 +65,30 @@ class TestBinarySectionReader(unittest.TestCase):
 			self.assertEqual(value, expected_value)
 		result = fileformat.read(self.file, spec)
 		self.assertEqual(result, { 'int': expected_value })
+	def test_uint_sizes(self):
+		file = io.BytesIO(b'\x01\x02\x03\x04\x05\x06')
+		def spec(f):
+			f.uint('three', 3)
+			f.uint('two', 2, byteorder='little')
+			f.int('one', 1)
+		result = fileformat.read(file, spec)
+		self.assertEqual(result, { 'three': 0x010203, 'two': 0x0504, 'one': 6 })
 	def test_struct(self):
 		def spec(f):
 			f.struct('struct', '>?3s')
 		result = fileformat.read(self.file, spec)
 		self.assertEqual(result, { 'struct': struct.unpack('>?3s', self.bytes) })
+	def test_ints(self):
+		def spec(f):
+			values = f.ints(('first', 'second'), '>BH')
+			self.assertEqual(values, (255, 0x3132))
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { 'first': 255, 'second': 0x3132 })
+	def test_ints_wrong_count(self):
+		def spec(f):
+			f.ints(('first',), '>BH')
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.read(self.file, spec)
 	def test_section(self):
 		self.entered_section = False
 		def spec(f):
@@ -75,17 +114,171 @@ class TestBinarySectionReader(unittest.TestCase):
 				f.uint('uints', 1)
 		result = fileformat.read(self.file, spec)
 		self.assertEqual(result, { 'uints': [b for b in self.bytes] })
+	def test_scan_until(self):
+		def spec(f):
+			f.scan_until('text', b'23')
+			f.bytes('end', 1)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { 'text': b'\xff1', 'end': b'2' })
+		self.assertEqual(self.file.tell(), 3)
+	def test_scan_until_eof(self):
+		def spec(f):
+			f.bytes('first', 2)
+			f.scan_until('text', b'\xff')
+		with self.assertRaisesRegex(EOFError, r'\(root\)\.text'):
+			fileformat.read(self.file, spec)
+	def test_repeat_until(self):
+		def spec(f):
+			f.repeat_until('sections', lambda f: f.bytes('byte', 1), 'byte', b'2')
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { 'sections': [{ 'byte': b'\xff' }, { 'byte': b'1' }, { 'byte': b'2' }] })
+		self.assertEqual(self.file.tell(), 3)
+	def test_repeat_until_eof(self):
+		def spec(f):
+			f.repeat_until('sections', lambda f: f.bytes('byte', 1), 'byte', b'4')
+		with self.assertRaisesRegex(EOFError, r'\(root\)\.sections\[4\]\.byte'):
+			fileformat.read(self.file, spec)
+	def test_handle_position(self):
+		def spec(f):
+			f.bytes('first', 1)
+			f.section('section', lambda f: f.bytes('second', 1))
+		fileformat.read(self.file, spec)
+		self.assertEqual(self.file.tell(), 2)
+		self.assertEqual(self.file.read(), self.bytes[2:])
+	def test_duplicate_name(self):
+		def spec(f):
+			f.uint('uint', 1)
+			f.uint('uint', 1)
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.read(self.file, spec)
+	def test_real_file(self):
+		def spec(f):
+			f.uint('uint', 2)
+		with tempfile.TemporaryFile() as file:
+			file.write(self.bytes)
+			file.seek(1)
+			result = fileformat.read(file, spec)
+			self.assertEqual(result, { 'uint': 0x3132 })
+			self.assertEqual(file.tell(), 3)
+	def test_gzip_file(self):
+		def spec(f):
+			f.bytes('bytes', len(self.bytes))
+		with tempfile.TemporaryFile() as file:
+			with gzip.GzipFile(fileobj=file, mode='wb') as compressed:
+				compressed.write(self.bytes)
+			file.seek(0)
+			with gzip.GzipFile(fileobj=file, mode='rb') as compressed:
+				result = fileformat.read(compressed, spec)
+		self.assertEqual(result, { 'bytes': self.bytes })
+	def test_record_loop(self):
+		def spec(f):
+			f.uint('index', 4)
+			f.bytes('text', 4)
+		records = b''.join(struct.pack('>I', i) + b'abcd' for i in range(1000))
+		with tempfile.TemporaryFile() as file:
+			file.write(records)
+			file.seek(0)
+			for i in range(1000):
+				self.assertEqual(fileformat.read(file, spec), { 'index': i, 'text': b'abcd' })
+				self.assertEqual(file.tell(), 8 * (i + 1))
+	def test_header_read_ahead(self):
+		class CountingIO(io.BytesIO):
+			read_count = 0
+			def read(self, size=-1):
+				data = super().read(size)
+				self.read_count += len(data)
+				return data
+		def spec(f):
+			f.uint('uint', 2)
+			f.scan_until('text', b'\xff')
+		with gzip.GzipFile(fileobj=io.BytesIO(gzip.compress(self.bytes * 100000)), mode='rb') as compressed:
+			result = fileformat.read(compressed, spec)
+			self.assertEqual(compressed.tell(), 4)
+		self.assertEqual(result, { 'uint': 0xff31, 'text': b'23' })
+		handle = CountingIO(self.bytes * 100000)
+		fileformat.read(handle, spec)
+		self.assertEqual(handle.tell(), 4)
+		self.assertLess(handle.read_count, 10000)
+	def test_mmap(self):
+		def spec(f):
+			f.uint('uint', 2)
+		with tempfile.TemporaryFile() as file:
+			file.write(self.bytes)
+			file.flush()
+			with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+				mapped.seek(1)
+				result = fileformat.read(mapped, spec)
+				self.assertEqual(result, { 'uint': 0x3132 })
+				self.assertEqual(mapped.tell(), 3)
+	def test_stream(self):
+		def spec(f):
+			f.uint('uint', 2)
+		read_fd, write_fd = os.pipe()
+		with open(read_fd, 'rb') as stream:
+			with open(write_fd, 'wb') as writer:
+				writer.write(b'\x01\x02\x03\x04')
+			self.assertEqual(fileformat.read(stream, spec), { 'uint': 0x0102 })
+			self.assertEqual(fileformat.read(stream, spec), { 'uint': 0x0304 })
+	def test_stream_fields(self):
+		def spec(f):
+			f.section('section', lambda f: f.ints(('first', 'second'), '>BB'))
+			f.scan_until('text', b'3')
+			f.array('uints')
+			f.uint('uints', 1)
+			f.uint('uints', 3)
+			f.bytes('rest', None)
+		read_fd, write_fd = os.pipe()
+		with open(read_fd, 'rb') as stream:
+			with open(write_fd, 'wb') as writer:
+				writer.write(self.bytes + b'\x00\x00\x01!')
+			result = fileformat.read(stream, spec)
+		self.assertEqual(result, { 'section': { 'first': 255, 'second': 0x31 }, 'text': b'2', 'uints': [0x33, 1], 'rest': b'!' })
 	def test_bytes_eof(self):
 		def spec(f):
 			f.bytes('too_long', len(self.bytes) + 1)
 		with self.assertRaises(EOFError):
 			fileformat.read(self.file, spec)
+	def test_skip_eof(self):
+		def spec(f):
+			f.section('section', lambda f: (f.skip(1), f.skip(len(self.bytes))))
+		with self.assertRaisesRegex(EOFError, r'\(root\)\.section\.__skipped\[1\]'):
+			fileformat.read(self.file, spec)
+	def test_section_array_eof(self):
+		def spec(f):
+			f.array('sections')
+			for i in range(3):
+				f.section('sections', lambda f: f.bytes('bytes', 2))
+		with self.assertRaisesRegex(EOFError, r'\(root\)\.sections\[2\]\.bytes'):
+			fileformat.read(self.file, spec)
+	def test_section_array_names(self):
+		names = []
+		def spec(f):
+			f.array('sections')
+			for i in range(2):
+				f.section('sections', lambda f: names.append((f.name, f.qualified_name())))
+		fileformat.read(self.file, spec)
+		self.assertEqual(names, [('sections', ['(root)', 'sections[0]']), ('sections', ['(root)', 'sections[1]'])])
 	def test_uint_eof(self):
 		def spec(f):
 			f.uint('too_long', len(self.bytes) + 1)
 		with self.assertRaises(EOFError):
 			fileformat.read(self.file, spec)
 
+class TestSimpleDict(unittest.TestCase):
+	def test_attributes(self):
+		data = SimpleDict({ 'first': 1 })
+		data.second = 2
+		self.assertEqual(data, { 'first': 1, 'second': 2 })
+		self.assertEqual(data.first, 1)
+		del data.first
+		self.assertFalse(hasattr(data, 'first'))
+		with self.assertRaises(AttributeError):
+			del data.first
+	def test_dict_method_names(self):
+		data = SimpleDict(items=1, keys=2)
+		self.assertEqual(data.items, 1)
+		self.assertEqual(data.keys, 2)
+
 class TestBinarySectionWriter(unittest.TestCase):
 	def setUp(self):
 		self.file = io.BytesIO()
@@ -110,6 +303,13 @@ class TestBinarySectionWriter(unittest.TestCase):
 		data = { 'text': b'12345' }
 		fileformat.write(self.file, data, spec)
 		self.assertEqual(self.file.getvalue(), b'\x0512345')
+	def test_count_overflow(self):
+		def spec(f):
+			count = f.count('tcount', 'text', 1)
+			f.bytes('text', count)
+		data = { 'text': b'1' * 256 }
+		with self.assertRaises(fileformat.DataFormatError):
+			fileformat.write(self.file, data, spec)
 	def test_bytes(self):
 		def spec(f):
 			first = f.bytes('first', 1)
@@ -133,6 +333,14 @@ class TestBinarySectionWriter(unittest.TestCase):
 		data = { 'int': -65536 }
 		fileformat.write(self.file, data, spec)
 		self.assertEqual(self.file.getvalue(), b'\xff\xff\x00\x00')
+	def test_int_sizes(self):
+		def spec(f):
+			f.int('three', 3)
+			f.int('two', 2, byteorder='little')
+			f.uint('eight', 8)
+		data = { 'three': -2, 'two': -2, 'eight': 1 }
+		fileformat.write(self.file, data, spec)
+		self.assertEqual(self.file.getvalue(), b'\xff\xff\xfe\xfe\xff' + b'\x00' * 7 + b'\x01')
 	def test_struct(self):
 		def spec(f):
 			struct_ = f.struct('struct', '>?3s')
@@ -140,6 +348,26 @@ class TestBinarySectionWriter(unittest.TestCase):
 		data = { 'struct': (False, b'yes') }
 		fileformat.write(self.file, data, spec)
 		self.assertEqual(self.file.getvalue(), b'\x00yes')
+	def test_ints(self):
+		def spec(f):
+			f.array('uints')
+			values = f.ints(('uints', 'uints', 'int'), '<BHh')
+			self.assertEqual(values, (1, 2, -3))
+		data = { 'uints': [1, 2], 'int': -3 }
+		fileformat.write(self.file, data, spec)
+		self.assertEqual(self.file.getvalue(), b'\x01\x02\x00\xfd\xff')
+	def test_ints_conversion(self):
+		def spec(f):
+			f.ints(('uint', 'float', 'bytes'), '>H f 2s')
+		data = { 'uint': 2.0, 'float': 0.5, 'bytes': b'ab' }
+		fileformat.write(self.file, data, spec)
+		self.assertEqual(self.file.getvalue(), b'\x00\x02\x3f\x00\x00\x00ab')
+	def test_ints_wrong_count(self):
+		def spec(f):
+			f.ints(('first',), '>2B')
+		data = { 'first': 1 }
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.write(self.file, data, spec)
 	def test_section(self):
 		self.entered_section = False
 		def spec(f):
@@ -161,6 +389,47 @@ class TestBinarySectionWriter(unittest.TestCase):
 		data = { 'uints': [1, 2, 3, 4] }
 		fileformat.write(self.file, data, spec)
 		self.assertEqual(self.file.getvalue(), b'\x01\x02\x03\x04')
+	def test_scan_until(self):
+		def spec(f):
+			f.scan_until('text', b'\x00')
+			f.bytes('end', 1)
+		data = { 'text': b'abc', 'end': b'\x00' }
+		fileformat.write(self.file, data, spec)
+		self.assertEqual(self.file.getvalue(), b'abc\x00')
+	def test_scan_until_contains_pattern(self):
+		def spec(f):
+			f.scan_until('text', b'\x00')
+		data = { 'text': b'a\x00c' }
+		with self.assertRaises(fileformat.DataFormatError):
+			fileformat.write(self.file, data, spec)
+	def test_repeat_until(self):
+		def spec(f):
+			f.repeat_until('sections', lambda f: f.uint('uint', 1), 'uint', 0)
+		data = { 'sections': [{ 'uint': 1 }, { 'uint': 2 }, { 'uint': 0 }] }
+		fileformat.write(self.file, data, spec)
+		self.assertEqual(self.file.getvalue(), b'\x01\x02\x00')
+	def test_repeat_until_no_sentinel(self):
+		def spec(f):
+			f.repeat_until('sections', lambda f: f.uint('uint', 1), 'uint', 0)
+		data = { 'sections': [{ 'uint': 1 }, { 'uint': 2 }] }
+		with self.assertRaises(fileformat.DataFormatError):
+			fileformat.write(self.file, data, spec)
+	def test_array_too_short(self):
+		def spec(f):
+			f.array('uints')
+			for i in range(3):
+				f.uint('uints', 1)
+		data = { 'uints': [1, 2] }
+		with self.assertRaises(fileformat.DataFormatError):
+			fileformat.write(self.file, data, spec)
+	def test_section_array_error(self):
+		def spec(f):
+			f.array('sections')
+			for i in range(2):
+				f.section('sections', lambda f: f.uint('uint', 1))
+		data = { 'sections': [{ 'uint': 1 }, { 'uint': 256 }] }
+		with self.assertRaisesRegex(fileformat.DataFormatError, r'\(root\)\.sections\[1\]\.uint'):
+			fileformat.write(self.file, data, spec)
 	def test_skipped_oversized(self):
 		def spec(f):
 			f.skip(2)
@@ -182,6 +451,23 @@ class TestBinarySectionWriter(unittest.TestCase):
 		with self.assertRaises(fileformat.DataFormatError):
 			fileformat.write(self.file, data, spec)
 			self.fail(f"Should have thrown a DataFormatError for trying to write uint value 65540 into a two-byte field, but wrote {self.file.getvalue()} instead.")
+	def test_buffered_error(self):
+		def spec(f):
+			f.bytes('first', 1)
+			f.uint('uint', 1)
+		data = { 'first': b'1', 'uint': 256 }
+		with self.assertRaises(fileformat.DataFormatError):
+			fileformat.write(self.file, data, spec)
+		self.assertEqual(self.file.getvalue(), b'')
+		with self.assertRaises(fileformat.DataFormatError):
+			fileformat.write(self.file, data, spec, buffered=False)
+		self.assertEqual(self.file.getvalue(), b'1')
+	def test_int_overflow(self):
+		def spec(f):
+			f.int('int', 3)
+		data = { 'int': -8388609 }
+		with self.assertRaisesRegex(fileformat.DataFormatError, r'-8388608 to 8388607'):
+			fileformat.write(self.file, data, spec)
 	def test_struct_oversized_string(self):
 		def spec(f):
 			f.struct('struct', '>4B')
@@ -190,5 +476,205 @@ class TestBinarySectionWriter(unittest.TestCase):
 			fileformat.write(self.file, data, spec)
 			self.fail(f"Should have thrown a DataFormatError for trying to write b'hello' into a 4-byte struct, but wrote {self.file.getvalue()} instead.")
 
+class TestCompileReader(unittest.TestCase):
+	def setUp(self):
+		self.bytes = b'\xff123\x00\x01'
+		self.file = io.BytesIO(self.bytes)
+	def test_compiled(self):
+		def section(f):
+			f.byteorder = 'little'
+			f.uint('uint', 2)
+		def spec(f):
+			f.struct('struct', '>?3s')
+			f.array('sections')
+			f.section('sections', section)
+			f.skip(0)
+		interpreted = fileformat.read(io.BytesIO(self.bytes), spec)
+		fileformat.compile_reader(spec)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, interpreted)
+		self.assertEqual(result.sections[0].uint, 256)
+		self.assertEqual(self.file.tell(), 6)
+	def test_compiled_ints(self):
+		def spec(f):
+			first, second = f.ints(('first', 'second'), '>BH')
+			f.ints((), '')
+		fileformat.compile_reader(spec)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { 'first': 255, 'second': 0x3132 })
+	def test_compiled_adjacent_ints(self):
+		file = io.BytesIO(bytes(range(40)))
+		def spec(f):
+			f.uint('a', 4)
+			f.int('b', 1)
+			f.uint('c', 2)
+			f.uint('d', 3)
+			f.uint('e', 2, byteorder='little')
+			f.int('f', 8, byteorder='little')
+			f.uint('g', 2)
+			f.array('uints')
+			f.uint('uints', 1)
+			f.uint('uints', 1)
+			f.uint('h', 1)
+		interpreted = fileformat.read(io.BytesIO(file.getvalue()), spec)
+		fileformat.compile_reader(spec)
+		result = fileformat.read(file, spec)
+		self.assertEqual(result, interpreted)
+		self.assertEqual(result.uints, [22, 23])
+		self.assertEqual(file.tell(), 25)
+	def test_compiled_arrays(self):
+		file = io.BytesIO(bytes(range(40)))
+		def spec(f):
+			f.array('uints')
+			f.array('ints')
+			for i in range(3):
+				f.uint('uints', 2)
+			f.int('ints', 1)
+			f.uint('uints', 4, byteorder='little')
+			for i in range(2):
+				f.uint('uints', 4, byteorder='little')
+				f.int('ints', 8)
+		interpreted = fileformat.read(io.BytesIO(file.getvalue()), spec)
+		fileformat.compile_reader(spec)
+		result = fileformat.read(file, spec)
+		self.assertEqual(result, interpreted)
+		self.assertEqual(len(result.uints), 6)
+	def test_compiled_byte_array(self):
+		def spec(f):
+			f.array('uints')
+			for i in range(len(self.bytes)):
+				f.uint('uints', 1)
+		fileformat.compile_reader(spec)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { 'uints': list(self.bytes) })
+	def test_compiled_result_types(self):
+		class Record(dict):
+			pass
+		def spec(f):
+			f.uint('uint', 1)
+			f.section('section', lambda f: f.bytes('bytes', 1))
+		fileformat.compile_reader(spec)
+		for result_type in (dict, SimpleDict, Record):
+			result = fileformat.read(io.BytesIO(self.bytes), spec, result_type=result_type)
+			self.assertIs(type(result), result_type)
+			self.assertIs(type(result['section']), result_type)
+			self.assertEqual(result, { 'uint': 255, 'section': { 'bytes': b'1' } })
+	def test_compiled_skip(self):
+		def spec(f):
+			f.skip(1)
+			f.bytes('bytes', 3)
+		fileformat.compile_reader(spec)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { '__skipped': [self.bytes[:1]], 'bytes': self.bytes[1:4] })
+		result = fileformat.read(io.BytesIO(self.bytes), spec, preserve_skipped=False)
+		self.assertEqual(result, { 'bytes': self.bytes[1:4] })
+	def test_compiled_section(self):
+		self.traced = 0
+		def section(f):
+			self.traced += 1
+			f.uint('uint', 1)
+		def spec(f):
+			f.array('sections')
+			while f.section('sections', section).uint != 0:
+				pass
+		fileformat.compile_reader(section)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(self.traced, 1)
+		self.assertEqual(result.sections, [{ 'uint': b } for b in self.bytes[:5]])
+	def test_compiled_method(self):
+		class Format:
+			def spec(self, f):
+				f.uint('uint', 2)
+		format_ = Format()
+		fileformat.compile_reader(format_.spec)
+		self.assertIn(format_.spec, fileformat._compiled_readers)
+		self.assertEqual(fileformat.read(self.file, format_.spec), { 'uint': 0xff31 })
+	def test_compiled_struct_unpacking(self):
+		def spec(f):
+			first, second = f.struct('struct', '>BB')
+		fileformat.compile_reader(spec)
+		result = fileformat.read(self.file, spec)
+		self.assertEqual(result, { 'struct': (255, 0x31) })
+	def test_uncompile(self):
+		calls = []
+		def spec(f):
+			calls.append(f)
+			f.uint('uint', 2)
+		fileformat.compile_reader(spec)
+		fileformat.read(self.file, spec)
+		self.assertEqual(len(calls), 1)
+		fileformat.uncompile_reader(spec)
+		fileformat.uncompile_reader(spec)
+		self.file.seek(0)
+		self.assertEqual(fileformat.read(self.file, spec), { 'uint': 0xff31 })
+		self.assertEqual(len(calls), 2)
+	def test_unhashable(self):
+		class Spec:
+			__hash__ = None
+			def __call__(self, f):
+				f.uint('uint', 1)
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.compile_reader(Spec())
+	def test_compiled_stream(self):
+		def header(f):
+			f.uint('uint', 1)
+		def rest(f):
+			f.bytes('rest', None)
+		def spec(f):
+			f.scan_until('text', b'2')
+			f.section('header', header)
+			f.section('rest', rest)
+		fileformat.compile_reader(header)
+		fileformat.compile_reader(rest)
+		read_fd, write_fd = os.pipe()
+		with open(read_fd, 'rb') as stream:
+			with open(write_fd, 'wb') as writer:
+				writer.write(self.bytes)
+			result = fileformat.read(stream, spec)
+		self.assertEqual(result, { 'text': b'\xff1', 'header': { 'uint': ord('2') }, 'rest': { 'rest': self.bytes[3:] } })
+	def test_compiled_mutable(self):
+		def spec(f):
+			f.bytes('bytes', 2, mutable=True)
+		fileformat.compile_reader(spec)
+		result = fileformat.read(self.file, spec)
+		self.assertIsInstance(result.bytes, bytearray)
+		self.assertEqual(result.bytes, self.bytes[:2])
+	def test_compiled_rest(self):
+		def spec(f):
+			f.int('int', 1)
+			f.bytes('rest', None)
+		compiled = fileformat.compile_reader(spec)
+		result, pos = compiled(memoryview(self.bytes), 2, dict, True)
+		self.assertEqual(result, { 'int': ord('2'), 'rest': self.bytes[3:] })
+		self.assertEqual(pos, len(self.bytes))
+	def test_compiled_eof(self):
+		def spec(f):
+			f.bytes('too_long', len(self.bytes) + 1)
+		fileformat.compile_reader(spec)
+		with self.assertRaises(EOFError):
+			fileformat.read(self.file, spec)
+	def test_data_dependent(self):
+		def spec(f):
+			count = f.uint('count', 1)
+			f.bytes('bytes', count)
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.compile_reader(spec)
+	def test_branching(self):
+		def spec(f):
+			if f.bytes('type', 1) == b'\xff':
+				f.uint('uint', 1)
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.compile_reader(spec)
+	def test_repeat_until(self):
+		def spec(f):
+			f.repeat_until('sections', lambda f: f.uint('uint', 1), 'uint', 0)
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.compile_reader(spec)
+	def test_scan_until(self):
+		def spec(f):
+			f.scan_until('text', b'\x00')
+		with self.assertRaises(fileformat.DefinitionError):
+			fileformat.compile_reader(spec)
+
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import unittest
-import zlib
+import io
+import mmap
 from pathlib import Path
 import os
 from binaryfile import fileformat
@@ -11,11 +12,7 @@ output_modified = test_dir / 'out/green_modified.png'
 
 def png_root(f):
 	header = f.bytes('header', 8)
-	f.array('chunks')
-	while True:
-		chunk = f.section('chunks', png_chunk)
-		if chunk.type == b'IEND':
-			break
+	f.repeat_until('chunks', png_chunk, 'type', b'IEND')
 
 def png_chunk(f):
 	length = f.uint('size', 4)
@@ -23,7 +20,7 @@ def png_chunk(f):
 	if type_ == b'IHDR':
 		data = f.section('data', png_ihdr)
 	else:
-		data = f.bytes('data', length)
+		data = f.bytes('data', length, mutable=True)
 	f.uint('crc', 4)
 
 def png_ihdr(f):
@@ -34,10 +31,16 @@ def png_ihdr(f):
 	f.uint('compression_method', 1)
 	f.uint('filter_method', 1)
 	f.uint('interlace_method', 1)
+fileformat.compile_reader(png_ihdr)
 
 def read_data(fname):
-	with open(fname, 'rb') as fh:
-		return fileformat.read(fh, png_root)
+	with open(fname, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+		data = fileformat.read(mapped, png_root)
+	# A list per type, since some chunks, such as IDAT, can occur more than once.
+	data.chunks_by_type = {}
+	for chunk in data.chunks:
+		data.chunks_by_type.setdefault(chunk.type, []).append(chunk)
+	return data
 def write_data(file, data):
 	Path(file).parent.mkdir(parents=True, exist_ok=True)
 	with open(file, 'wb') as fh:
@@ -46,11 +49,10 @@ def slurp_bytes(file):
 	with open(file, 'rb') as fh:
 		return fh.read()
 def set_palette(data, index, rgb):
-	types = [chunk.type for chunk in data.chunks]
-	palette = data.chunks[types.index(b'PLTE')]
-	palette.data = bytearray(palette.data)
+	import zlib
+	palette = data.chunks_by_type[b'PLTE'][0]
 	palette.data[index * 3 : index * 3 + 3] = rgb
-	palette.crc = zlib.crc32(palette.type + palette.data)
+	palette.crc = zlib.crc32(palette.data, zlib.crc32(palette.type))
 
 class TestPng(unittest.TestCase):
 	def testReadPng(self):
@@ -63,10 +65,19 @@ class TestPng(unittest.TestCase):
 		self.assertEqual(ihdr_chunk.data.color_type, 3)  # Indexed
 		iend_chunk = data.chunks[-1]
 		self.assertEqual(iend_chunk.type, b'IEND')
+	def testFindIend(self):
+		def spec(f):
+			f.bytes('header', 8)
+			f.scan_until('chunks', b'IEND')
+			f.bytes('end', 4)
+		with open(input_file, 'rb') as fh:
+			data = fileformat.read(fh, spec)
+		self.assertEqual(data.end, b'IEND')
 	def testWriteUnmodifiedPng(self):
-		data = read_data(input_file)
+		original = slurp_bytes(input_file)
+		data = fileformat.read(io.BytesIO(original), png_root)
 		write_data(output_unmodified, data)
-		self.assertEqual(slurp_bytes(input_file), slurp_bytes(output_unmodified))
+		self.assertEqual(original, slurp_bytes(output_unmodified))
 	def testWriteModifiedPng(self):
 		data = read_data(input_file)
 		set_palette(data, 4, (255, 0, 255))